@@ -1,45 +1,125 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse, Response
 from app.services.report_service import ReportService
 from app.services.excel_service import ExcelService
 from app.models.schemas import ReportResponse
-import io
+from app.core.config import settings
+from typing import Optional
+import async_timeout
+import email.utils
 import logging
+import orjson
+import os
 import time
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# (unix second, formatted HTTP date, unix second as string) memo
+_http_date_cache = [0, "", ""]
+
+def _iter_excel_file(path: str, chunk_size: int = 65536):
+    """Yield an xlsx temp file in chunks and delete it once fully sent"""
+    try:
+        with open(path, 'rb') as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+    finally:
+        os.unlink(path)
+
+def _http_date_and_ts():
+    """Return the current HTTP date header value and unix timestamp string, cached per second"""
+    now = int(time.time())
+    if now != _http_date_cache[0]:
+        _http_date_cache[:] = [now, email.utils.formatdate(now, usegmt=True), str(now)]
+    return _http_date_cache[1], _http_date_cache[2]
+
+async def _fetch_period_stamp(subdomain: str, period_id: int):
+    """Fetch MAX(updated_at) of one subdomain's liquidations for a period"""
+    from app.core.database import db_manager
+    async with db_manager.acquire(subdomain) as connection:
+        cursor = await connection.cursor()
+        await cursor.execute(
+            "SELECT MAX(updated_at) FROM liquidations WHERE period_id = %s",
+            (period_id,)
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+        return row[0] if row else None
+
+async def _compute_report_etag(period_id: int) -> Optional[str]:
+    """
+    Compute a deterministic ETag for a period so clients can revalidate.
+    Hashes MAX(updated_at) from liquidations across every subdomain the
+    report aggregates, so a data change in any tenant invalidates the tag.
+    Each probe is an indexed single-row query over pooled connections.
+    """
+    try:
+        import asyncio
+        import hashlib
+
+        from app.core.database import db_manager
+        subdomains = db_manager.get_available_subdomains()
+        if not subdomains:
+            return None
+
+        stamps = await asyncio.gather(
+            *[_fetch_period_stamp(s, period_id) for s in subdomains],
+            return_exceptions=True
+        )
+
+        # Unreachable tenants hash as a marker instead of aborting, so the
+        # tag still flips when a tenant drops out of (or back into) the report
+        digest = hashlib.md5()
+        for subdomain, stamp in zip(subdomains, stamps):
+            if isinstance(stamp, Exception):
+                stamp = "unavailable"
+            digest.update(f"{subdomain}={stamp};".encode())
+
+        return f'"{period_id}-{digest.hexdigest()}"'
+
+    except Exception as e:
+        logger.warning(f"Could not compute ETag for period {period_id}: {str(e)}")
+        return None
+
 @router.get("/reports/{period_id}", response_model=ReportResponse)
-async def generate_report(period_id: int):
+async def generate_report(period_id: int, request: Request):
     """
     Generate report by aggregating data from all subdomains for a specific period
     """
     try:
         import asyncio
-        
+
+        # Honor conditional requests before doing any expensive work
+        etag = await _compute_report_etag(period_id)
+        if etag and request.headers.get("if-none-match") == etag:
+            return Response(
+                status_code=304,
+                headers={"ETag": etag, "Cache-Control": "no-cache, must-revalidate"}
+            )
+
         # Add timeout to prevent hanging
         report_service = ReportService()
-        report_data = await asyncio.wait_for(
-            report_service.generate_report(period_id), 
-            timeout=300.0  # 5 minutes timeout
-        )
-        
-        # Create response with cache-busting headers
-        response = ReportResponse(**report_data)
+        async with async_timeout.timeout(300):  # 5 minutes timeout
+            report_data = await report_service.generate_report(period_id)
         
-        # Add cache-busting headers to prevent stale data
+        # Full Pydantic validation is O(rows); keep it as a debug-only self-check
+        if settings.DEBUG:
+            ReportResponse(**report_data)
+
+        # Cache headers: clients may cache but must revalidate against the ETag
+        http_date, timestamp = _http_date_and_ts()
         headers = {
-            "Cache-Control": "no-cache, no-store, must-revalidate",
+            "Cache-Control": "no-cache, must-revalidate",
             "Pragma": "no-cache",
             "Expires": "0",
-            "Last-Modified": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime()),
-            "ETag": f'"{int(time.time())}-{period_id}"'
+            "Last-Modified": http_date,
+            "ETag": etag or f'"{timestamp}-{period_id}"'
         }
-        
+
         return Response(
-            content=response.model_dump_json(),
+            content=orjson.dumps(report_data),
             media_type="application/json",
             headers=headers
         )
@@ -52,38 +132,50 @@ async def generate_report(period_id: int):
         raise HTTPException(status_code=500, detail=f"Error generating report: {str(e)}")
 
 @router.get("/reports/{period_id}/excel")
-async def generate_excel_report(period_id: int):
+async def generate_excel_report(period_id: int, request: Request):
     """
     Generate Excel report by aggregating data from all subdomains for a specific period
     """
     try:
         import asyncio
-        
+
+        # Honor conditional requests before doing any expensive work
+        etag = await _compute_report_etag(period_id)
+        if etag and request.headers.get("if-none-match") == etag:
+            return Response(
+                status_code=304,
+                headers={"ETag": etag, "Cache-Control": "no-cache, must-revalidate"}
+            )
+
         report_service = ReportService()
         excel_service = ExcelService()
-        
+
         # Get report data with timeout
-        report_data = await asyncio.wait_for(
-            report_service.generate_report(period_id), 
-            timeout=300.0  # 5 minutes timeout
-        )
+        async with async_timeout.timeout(300):  # 5 minutes timeout
+            report_data = await report_service.generate_report(period_id)
         
-        # Generate Excel file
-        excel_buffer = excel_service.create_excel_report(report_data['data'])
+        # Generate Excel file on disk so it can be streamed chunk-by-chunk.
+        # openpyxl is CPU-bound, so run it in a worker thread to keep the
+        # event loop free for other requests.
+        loop = asyncio.get_running_loop()
+        excel_path = await loop.run_in_executor(
+            None, excel_service.create_excel_report_file, report_data['data']
+        )
         
-        # Add cache-busting headers to prevent stale data
+        # Cache headers: clients may cache but must revalidate against the ETag
+        http_date, timestamp = _http_date_and_ts()
         headers = {
-            "Content-Disposition": f"attachment; filename=nutresa_report_period_{period_id}_{int(time.time())}.xlsx",
-            "Cache-Control": "no-cache, no-store, must-revalidate",
+            "Content-Disposition": f"attachment; filename=nutresa_report_period_{period_id}_{timestamp}.xlsx",
+            "Cache-Control": "no-cache, must-revalidate",
             "Pragma": "no-cache",
             "Expires": "0",
-            "Last-Modified": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime()),
-            "ETag": f'"{int(time.time())}-{period_id}"'
+            "Last-Modified": http_date,
+            "ETag": etag or f'"{timestamp}-{period_id}"'
         }
         
         # Return Excel file as streaming response
         return StreamingResponse(
-            io.BytesIO(excel_buffer),
+            _iter_excel_file(excel_path),
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers=headers
         )
@@ -95,41 +187,79 @@ async def generate_excel_report(period_id: int):
         logger.error(f"Error generating Excel report: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating Excel report: {str(e)}")
 
+# Periods change at most once per month; cache the merged response
+_PERIODS_CACHE_TTL = 300.0
+_periods_cache = {"expires": 0.0, "value": None}
+
+async def _fetch_periods(subdomain: str):
+    """Fetch the most recent periods from one subdomain"""
+    from app.core.database import db_manager
+    async with db_manager.acquire(subdomain) as connection:
+        cursor = await connection.cursor()
+        await cursor.execute("""
+            SELECT id, start_date, end_date, name
+            FROM periods
+            ORDER BY start_date DESC
+            LIMIT 20
+        """)
+        results = await cursor.fetchall()
+        await cursor.close()
+        return results
+
 @router.get("/periods")
 async def get_periods():
     """
     Get list of available periods
     """
     try:
+        import asyncio
+
+        if _periods_cache["value"] is not None and time.monotonic() < _periods_cache["expires"]:
+            return _periods_cache["value"]
+
         from app.core.database import db_manager
-        # Get periods from the first available subdomain as a sample
         subdomains = db_manager.get_available_subdomains()
         if not subdomains:
             return {"periods": [], "message": "No subdomains available"}
-        
-        connection = await db_manager.get_connection(subdomains[0])
-        cursor = await connection.cursor()
-        
-        await cursor.execute("""
-            SELECT id, start_date, end_date, name 
-            FROM periods 
-            ORDER BY start_date DESC 
-            LIMIT 20
-        """)
-        results = await cursor.fetchall()
-        await cursor.close()
-        
+
+        # Prefer the configured master subdomain; otherwise sample a few
+        # subdomains concurrently and merge, so one dead tenant can't take
+        # the endpoint down with it.
+        if settings.DB_MASTER_SUBDOMAIN in subdomains:
+            sample = [settings.DB_MASTER_SUBDOMAIN]
+        else:
+            sample = subdomains[:3]
+
+        fetches = await asyncio.gather(
+            *[_fetch_periods(s) for s in sample],
+            return_exceptions=True
+        )
+
+        merged = {}
+        for fetch in fetches:
+            if isinstance(fetch, Exception):
+                logger.warning(f"Periods fetch failed for one subdomain: {str(fetch)}")
+                continue
+            for row in fetch:
+                merged.setdefault(row[0], row)
+
+        if not merged:
+            raise Exception("No subdomain returned periods")
+
         periods = []
-        for row in results:
+        for row in sorted(merged.values(), key=lambda r: (r[1] is not None, r[1]), reverse=True):
             periods.append({
                 "id": row[0],
                 "start_date": row[1].isoformat() if row[1] else None,
                 "end_date": row[2].isoformat() if row[2] else None,
                 "name": row[3] or f"Period {row[0]}"
             })
-        
-        return {"periods": periods}
-        
+
+        response = {"periods": periods}
+        _periods_cache["value"] = response
+        _periods_cache["expires"] = time.monotonic() + _PERIODS_CACHE_TTL
+        return response
+
     except Exception as e:
         logger.error(f"Error getting periods: {str(e)}")
         # Return mock periods if database query fails
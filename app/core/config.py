@@ -1,7 +1,7 @@
 from pydantic_settings import BaseSettings
 from pydantic import field_validator
+from functools import lru_cache
 from typing import List
-import os
 import json
 
 class Settings(BaseSettings):
@@ -16,6 +16,9 @@ class Settings(BaseSettings):
     
     # Subdomains configuration
     SUBDOMAINS_FILE: str = "static/subdomains.json"
+    WARM_POOLS_ON_STARTUP: bool = False
+    # Preferred subdomain for shared lookups like /periods; falls back to sampling
+    DB_MASTER_SUBDOMAIN: str = ""
     
     # CORS settings
     ALLOWED_ORIGINS: List[str] = ["*"]
@@ -45,4 +48,9 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
         case_sensitive = True
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build Settings once per process; repeated calls reuse the same instance"""
+    return Settings()
+
+settings = get_settings()
@@ -1,62 +1,163 @@
 import aiomysql
-from typing import Dict, Any, List
+import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from pymysql.constants import FIELD_TYPE
+from pymysql.converters import conversions
+from typing import Dict, Any, List, Optional
 from app.core.config import settings
-import json
-import os
+import orjson
+import time
+
+# How long a schema-existence verdict stays valid; tenant schemas only change
+# on deploys
+_TABLES_KNOWN_TTL = 300.0
+
+# The driver decodes DECIMAL columns to decimal.Decimal by default, but all
+# the report math is plain float; decoding to float here removes a float()
+# cast per field per row from the aggregation loops
+_CONVERSIONS = dict(conversions)
+_CONVERSIONS[FIELD_TYPE.DECIMAL] = float
+_CONVERSIONS[FIELD_TYPE.NEWDECIMAL] = float
+
+@lru_cache(maxsize=1)
+def _load_subdomains_cached(path: str) -> Dict[str, str]:
+    """Load subdomains configuration from JSON file, parsed once per process"""
+    try:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+    except orjson.JSONDecodeError:
+        return {}
 
 class DatabaseManager:
     def __init__(self):
-        # Removed connection caching to prevent stale data
-        self.subdomains = self._load_subdomains()
-    
-    def _load_subdomains(self) -> Dict[str, str]:
-        """Load subdomains configuration from JSON file"""
-        try:
-            with open(settings.SUBDOMAINS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-        except json.JSONDecodeError:
-            return {}
-    
-    async def get_connection(self, subdomain: str = None) -> aiomysql.Connection:
-        """Get fresh database connection for specific subdomain or master database (no caching)"""
+        self.subdomains = _load_subdomains_cached(settings.SUBDOMAINS_FILE)
+        self._subdomain_list = tuple(self.subdomains.keys())
+        # One connection pool per database, created lazily on first use
+        self._pools: Dict[Optional[str], aiomysql.Pool] = {}
+        self._pools_lock = asyncio.Lock()
+        # subdomain -> (has required tables, monotonic expiry); shared by all
+        # services so each schema is probed once per TTL, not once per service
+        self._tables_known: Dict[str, tuple] = {}
+
+    def reload_subdomains(self) -> Dict[str, str]:
+        """Re-read the subdomains file (for ops use after editing the JSON)"""
+        _load_subdomains_cached.cache_clear()
+        self.subdomains = _load_subdomains_cached(settings.SUBDOMAINS_FILE)
+        self._subdomain_list = tuple(self.subdomains.keys())
+        return self.subdomains
+
+    async def _get_pool(self, db_name: Optional[str]) -> aiomysql.Pool:
+        """Get or lazily create the connection pool for a specific database"""
+        pool = self._pools.get(db_name)
+        if pool is not None:
+            return pool
+
+        async with self._pools_lock:
+            # Re-check after acquiring the lock in case another task created it
+            pool = self._pools.get(db_name)
+            if pool is None:
+                pool = await aiomysql.create_pool(
+                    host=settings.DB_HOST,
+                    port=settings.DB_PORT,
+                    user=settings.DB_USER,
+                    password=settings.DB_PASSWORD,
+                    db=db_name,
+                    charset='utf8mb4',
+                    autocommit=True,
+                    conv=_CONVERSIONS,
+                    minsize=1,
+                    maxsize=settings.DB_POOL_SIZE,
+                    pool_recycle=300
+                )
+                self._pools[db_name] = pool
+
+        return pool
+
+    @asynccontextmanager
+    async def acquire(self, subdomain: str = None):
+        """Acquire a pooled database connection for a specific subdomain or the master database"""
         if subdomain and subdomain in self.subdomains:
             db_name = self.subdomains[subdomain]
         else:
             # Connect to MySQL server without specific database
             db_name = None
-        
-        # Always create a fresh connection to prevent stale data
-        connection = await aiomysql.connect(
-            host=settings.DB_HOST,
-            port=settings.DB_PORT,
-            user=settings.DB_USER,
-            password=settings.DB_PASSWORD,
-            db=db_name,
-            charset='utf8mb4',
-            autocommit=True
-        )
-        
-        if connection is None:
-            raise Exception(f"Failed to connect to database: {db_name or 'default'}")
-        
-        return connection
-    
+
+        pool = await self._get_pool(db_name)
+        async with pool.acquire() as connection:
+            yield connection
+
     async def close_all_connections(self):
-        """Close all database connections (no longer needed since we don't cache connections)"""
-        # No longer needed since we create fresh connections each time
-        pass
-    
+        """Close all connection pools"""
+        async with self._pools_lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+
+        for pool in pools:
+            pool.close()
+            await pool.wait_closed()
+
+    async def _probe_subdomain(self, subdomain_name: str, db_name: str):
+        """Probe a single subdomain and return (name, result_dict, success)"""
+        try:
+            # Test connection to this subdomain through its pool
+            async with self.acquire(subdomain_name) as connection:
+                cursor = await connection.cursor()
+
+                # Single round-trip covering test query, time, database info and table count
+                await cursor.execute("""
+                    SELECT 1, NOW(), DATABASE(), VERSION(),
+                           (SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE())
+                """)
+                row = await cursor.fetchone()
+                await cursor.close()
+
+                test_result, current_time, actual_db, mysql_version, table_count = row
+
+                return subdomain_name, {
+                    "status": "connected",
+                    "database_name": db_name,
+                    "test_query_result": test_result,
+                    "current_time": str(current_time) if current_time else None,
+                    "database_name_actual": actual_db,
+                    "mysql_version": mysql_version,
+                    "table_count": table_count or 0
+                }, True
+
+        except Exception as e:
+            return subdomain_name, {
+                "status": "error",
+                "database_name": db_name,
+                "error": str(e),
+                "error_type": type(e).__name__
+            }, False
+
+    def has_required_tables(self, subdomain: str) -> Optional[bool]:
+        """Cached verdict on whether a subdomain has the report tables, or None if unknown/expired"""
+        cached = self._tables_known.get(subdomain)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+        return None
+
+    def remember_required_tables(self, subdomain: str, exists: bool):
+        """Record a fresh schema-existence verdict for a subdomain"""
+        self._tables_known[subdomain] = (exists, time.monotonic() + _TABLES_KNOWN_TTL)
+
+    def forget_required_tables(self, subdomain: str):
+        """Drop the cached verdict (e.g. after a connection error) so the next request re-probes"""
+        self._tables_known.pop(subdomain, None)
+
     def get_available_subdomains(self) -> List[str]:
         """Get list of available subdomains"""
-        return list(self.subdomains.keys())
-    
+        return list(self._subdomain_list)
+
     async def test_all_subdomains(self) -> Dict[str, Any]:
         """Test connection to all configured subdomains (each subdomain is a database within the main MySQL server)"""
         # Test only the first 5 subdomains
         subdomains_to_test = dict(list(self.subdomains.items())[:5])
-        
+
         results = {
             "total_subdomains_configured": len(self.subdomains),
             "total_subdomains_tested": len(subdomains_to_test),
@@ -65,7 +166,7 @@ class DatabaseManager:
             "subdomain_results": {},
             "summary": {}
         }
-        
+
         if not self.subdomains:
             return {
                 "status": "warning",
@@ -73,75 +174,26 @@ class DatabaseManager:
                 "subdomains_file": settings.SUBDOMAINS_FILE,
                 "results": results
             }
-        
-        # Test only the first 5 subdomains
-        subdomains_to_test = dict(list(self.subdomains.items())[:5])
-        
-        for subdomain_name, db_name in subdomains_to_test.items():
-            try:
-                # Test connection to this subdomain
-                connection = await aiomysql.connect(
-                    host=settings.DB_HOST,
-                    port=settings.DB_PORT,
-                    user=settings.DB_USER,
-                    password=settings.DB_PASSWORD,
-                    db=db_name,
-                    charset='utf8mb4',
-                    autocommit=True
-                )
-                
-                if connection:
-                    cursor = await connection.cursor()
-                    
-                    # Test basic query
-                    await cursor.execute("SELECT 1")
-                    result = await cursor.fetchone()
-                    
-                    # Get current time
-                    await cursor.execute("SELECT NOW()")
-                    time_result = await cursor.fetchone()
-                    
-                    # Get database info
-                    await cursor.execute("SELECT DATABASE()")
-                    db_name_result = await cursor.fetchone()
-                    
-                    await cursor.execute("SELECT VERSION()")
-                    version_result = await cursor.fetchone()
-                    
-                    # Get table count
-                    await cursor.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE()")
-                    table_count = await cursor.fetchone()
-                    
-                    await cursor.close()
-                    await connection.ensure_closed()
-                    
-                    results["subdomain_results"][subdomain_name] = {
-                        "status": "connected",
-                        "database_name": db_name,
-                        "test_query_result": result[0] if result else None,
-                        "current_time": str(time_result[0]) if time_result else None,
-                        "database_name_actual": db_name_result[0] if db_name_result else None,
-                        "mysql_version": version_result[0] if version_result else None,
-                        "table_count": table_count[0] if table_count else 0
-                    }
-                    results["successful_connections"] += 1
-                else:
-                    results["subdomain_results"][subdomain_name] = {
-                        "status": "error",
-                        "database_name": db_name,
-                        "error": "Connection returned None"
-                    }
-                    results["failed_connections"] += 1
-                    
-            except Exception as e:
-                results["subdomain_results"][subdomain_name] = {
-                    "status": "error",
-                    "database_name": db_name,
-                    "error": str(e),
-                    "error_type": type(e).__name__
-                }
+
+        # Probe all subdomains concurrently - they are independent databases
+        probes = await asyncio.gather(
+            *[self._probe_subdomain(name, db) for name, db in subdomains_to_test.items()],
+            return_exceptions=True
+        )
+
+        for probe in probes:
+            if isinstance(probe, Exception):
+                # Should not happen since _probe_subdomain catches, but keep the report complete
+                results["failed_connections"] += 1
+                continue
+
+            subdomain_name, subdomain_result, success = probe
+            results["subdomain_results"][subdomain_name] = subdomain_result
+            if success:
+                results["successful_connections"] += 1
+            else:
                 results["failed_connections"] += 1
-        
+
         # Generate summary
         results["summary"] = {
             "connection_success_rate": f"{(results['successful_connections'] / results['total_subdomains_tested'] * 100):.1f}%" if results['total_subdomains_tested'] > 0 else "0%",
@@ -153,7 +205,7 @@ class DatabaseManager:
                 "password": "***" if settings.DB_PASSWORD else "None"
             }
         }
-        
+
         return {
             "status": "completed",
             "message": f"Tested {results['total_subdomains_tested']} of {results['total_subdomains_configured']} subdomains (first 5 only)",
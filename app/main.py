@@ -1,12 +1,39 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import logging
 from app.api.routes import reports
 from app.core.config import settings
+from app.core.database import db_manager
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm connection pools so the first report doesn't pay N cold handshakes.
+    # Gated behind a flag so local development keeps fast startups.
+    if settings.WARM_POOLS_ON_STARTUP:
+        for subdomain in db_manager.get_available_subdomains():
+            try:
+                async with db_manager.acquire(subdomain) as connection:
+                    cursor = await connection.cursor()
+                    await cursor.execute("SELECT 1")
+                    await cursor.fetchone()
+                    await cursor.close()
+            except Exception as e:
+                logger.warning(f"Could not warm pool for {subdomain}: {str(e)}")
+
+    yield
+
+    await db_manager.close_all_connections()
 
 app = FastAPI(
     title="Nutresa Maestro Reports API",
     description="API for generating reports from Nutresa Maestro database with subdomain support",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -1,75 +1,90 @@
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
 from typing import List, Dict, Any
 from app.models.schemas import ReportRow
-import io
+import tempfile
+
+# Headers for the report structure
+_HEADERS = (
+    "Código de Agente", "Nombre del Agente", "Período de Tiempo", "Variable",
+    "Meta Asignada", "Meta Distribuida", "% Meta", "Incentivo Asignado",
+    "Incentivo Distribuido", "% Incentivo Ejecutado", "% Variables Completadas"
+)
+
+# Header styles are immutable; build them once at import time
+_HEADER_FONT = Font(bold=True, color="FFFFFF")
+_HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+_HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
 
 class ExcelService:
-    
-    def create_excel_report(self, data: List[Dict[str, Any]]) -> bytes:
+
+    def create_excel_report_file(self, data: List[Dict[str, Any]]) -> str:
         """
-        Create Excel report from report data
+        Create Excel report from report data using a streaming write-only workbook.
+        Returns the path of a temporary xlsx file; the caller is responsible for
+        deleting it once served.
         """
-        workbook = Workbook()
-        worksheet = workbook.active
-        worksheet.title = "Nutresa Report"
-        
-        # Define headers for the report structure
-        headers = [
-            "Código de Agente", "Nombre del Agente", "Período de Tiempo", "Variable",
-            "Meta Asignada", "Meta Distribuida", "% Meta", "Incentivo Asignado",
-            "Incentivo Distribuido", "% Incentivo Ejecutado", "% Variables Completadas"
-        ]
-        
-        # Style for headers
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Write headers
-        for col, header in enumerate(headers, 1):
-            cell = worksheet.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-        
-        # Write data
-        for row_idx, report_row in enumerate(data, 2):
-            row_data = [
-                report_row.get("codigo_agente", ""),
-                report_row.get("nombre_agente", ""),
-                report_row.get("periodo_tiempo", ""),
-                report_row.get("variable", ""),
-                report_row.get("meta_asignada", 0),
-                report_row.get("meta_distribuida", 0),
-                f"{report_row.get('porcentaje_meta', 0)}%" if report_row.get('porcentaje_meta') is not None else "0.00%",
-                report_row.get("incentivo_asignado", 0),
-                report_row.get("incentivo_distribuido", 0),
-                f"{report_row.get('porcentaje_ejecucion_incentivo', 0)}%" if report_row.get('porcentaje_ejecucion_incentivo') is not None else "0.00%",
-                f"{report_row.get('porcentaje_variables_completadas', 0)}%" if report_row.get('porcentaje_variables_completadas') is not None else "0.00%"
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet("Nutresa Report")
+
+        # Build all rows up front. Local binds keep attribute and dict
+        # lookups out of the hot loop.
+        rows = []
+        rows_append = rows.append
+        for report_row in data:
+            get = report_row.get
+            pct_meta = get("porcentaje_meta")
+            pct_incentivo = get("porcentaje_ejecucion_incentivo")
+            pct_variables = get("porcentaje_variables_completadas")
+            row_data = (
+                get("codigo_agente", ""),
+                get("nombre_agente", ""),
+                get("periodo_tiempo", ""),
+                get("variable", ""),
+                get("meta_asignada", 0),
+                get("meta_distribuida", 0),
+                f"{pct_meta}%" if pct_meta is not None else "0.00%",
+                get("incentivo_asignado", 0),
+                get("incentivo_distribuido", 0),
+                f"{pct_incentivo}%" if pct_incentivo is not None else "0.00%",
+                f"{pct_variables}%" if pct_variables is not None else "0.00%"
+            )
+
+            rows_append(row_data)
+
+        # Transpose once and compute each column width with C-level max/map
+        # instead of a Python inner loop per row
+        if rows:
+            widths = [
+                max(len(header), max(map(len, map(str, column))))
+                for header, column in zip(_HEADERS, zip(*rows))
             ]
-            
-            for col, value in enumerate(row_data, 1):
-                worksheet.cell(row=row_idx, column=col, value=value)
-        
-        # Auto-adjust column widths
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            
-            adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        # Save to bytes
-        excel_buffer = io.BytesIO()
-        workbook.save(excel_buffer)
-        excel_buffer.seek(0)
-        
-        return excel_buffer.getvalue()
+        else:
+            widths = [len(header) for header in _HEADERS]
+
+        # Column widths must be set before rows are appended in write-only mode
+        for col, width in enumerate(widths, 1):
+            worksheet.column_dimensions[get_column_letter(col)].width = min(width + 2, 50)
+
+        # Write styled headers
+        header_cells = []
+        for header in _HEADERS:
+            cell = WriteOnlyCell(worksheet, value=header)
+            cell.font = _HEADER_FONT
+            cell.fill = _HEADER_FILL
+            cell.alignment = _HEADER_ALIGNMENT
+            header_cells.append(cell)
+        worksheet.append(header_cells)
+
+        # Stream data rows
+        ws_append = worksheet.append
+        for row_data in rows:
+            ws_append(row_data)
+
+        # Save to a temporary file so the route can stream it without holding
+        # the whole xlsx in memory
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as tmp:
+            workbook.save(tmp.name)
+            return tmp.name
@@ -1,30 +1,214 @@
-from typing import List, Dict, Any
+from datetime import date
+from functools import lru_cache
+from typing import AsyncIterator, List, Dict, Any, Optional
+from app.core.config import settings
 from app.core.database import db_manager
 from app.models.schemas import ReportRow
-from datetime import datetime
+import aiomysql
+import asyncio
 import logging
-import json
+import math
+import orjson
 import os
+import time
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=1)
+def _load_nin_data_cached(path: str) -> Dict[str, str]:
+    """Load the subdomain -> NIN mapping from nin.json, parsed once per process"""
+    try:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    except Exception as e:
+        logger.error(f"Error loading nin.json: {str(e)}")
+        return {}
+
+# Indexes the report queries rely on (apply to every tenant schema in
+# migrations). Without them the period predicates below degrade into full
+# scans of liquidations per agent:
+#   CREATE INDEX idx_liq_period ON liquidations (period_id, variable_id, program_id);
+#   CREATE INDEX idx_rules_user_var ON rules (user_id, variable_id);
+# Covering variant (InnoDB has no INCLUDE, so the read columns go on the
+# key tail): serves the aggregation entirely from the index, skipping the
+# clustered-row lookup per liquidation:
+#   CREATE INDEX idx_liq_period_cov ON liquidations
+#       (period_id, program_id, nin, variable_id, goal, results);
+
+# Static subdomain -> agent display name mapping; built once at import time
+# since it's consulted for every report row
+_AGENT_NAMES = {
+    "1030773": "A.H.H. DISTRIBUCIONES S.A.S",
+    "1089723": "NUTRICOL SAS",
+    "comercruz": "COMERCRUZ DISTRIBUCIONES",
+    "santiagodetunja": "SANTIAGO DE TUNJA COMERCIAL",
+    "maxgol": "MAXGOL DISTRIBUCIONES",
+    "distrimarcasagentecomercial": "DISTRIMARCAS",
+    "jyddistribuciones": "JYD DISTRIBUCIONES",
+    "lideraliados": "LIDERALIADOS"
+}
+
+# Fallback rows served when a subdomain lacks the report tables. Based on the
+# liquidations table logic: MAX(goal) per vendor, SUM(results), SUM(points).
+# Nothing is ever distributed in mock data, so every percentage is 0 and the
+# row shapes can be precomputed; only the agent fields vary per subdomain.
+_MOCK_TEMPLATES = (
+    {"variable": "CSI - Frijoles Zenú 2da Etapa", "meta_asignada": 0, "meta_distribuida": 0,
+     "porcentaje_meta": 0.0, "incentivo_asignado": 0, "incentivo_distribuido": 0,
+     "porcentaje_variables_completadas": 0.0, "porcentaje_ejecucion_incentivo": 0.0,
+     "user_id": None, "program_id": 1},
+    {"variable": "CSI - Snack de Película", "meta_asignada": 3, "meta_distribuida": 0,
+     "porcentaje_meta": 0.0, "incentivo_asignado": 150, "incentivo_distribuido": 0,
+     "porcentaje_variables_completadas": 0.0, "porcentaje_ejecucion_incentivo": 0.0,
+     "user_id": None, "program_id": 1},
+    {"variable": "CSI - Tosh Manzanilla Limoncillo 2da Etapa", "meta_asignada": 0, "meta_distribuida": 0,
+     "porcentaje_meta": 0.0, "incentivo_asignado": 0, "incentivo_distribuido": 0,
+     "porcentaje_variables_completadas": 0.0, "porcentaje_ejecucion_incentivo": 0.0,
+     "user_id": None, "program_id": 1},
+    {"variable": "CSI- Ahorramax 2da Etapa AU", "meta_asignada": 0, "meta_distribuida": 0,
+     "porcentaje_meta": 0.0, "incentivo_asignado": 0, "incentivo_distribuido": 0,
+     "porcentaje_variables_completadas": 0.0, "porcentaje_ejecucion_incentivo": 0.0,
+     "user_id": None, "program_id": 1},
+    {"variable": "CSI- Ahorramax 2da Etapa TD", "meta_asignada": 0, "meta_distribuida": 0,
+     "porcentaje_meta": 0.0, "incentivo_asignado": 0, "incentivo_distribuido": 0,
+     "porcentaje_variables_completadas": 0.0, "porcentaje_ejecucion_incentivo": 0.0,
+     "user_id": None, "program_id": 1},
+    {"variable": "DN - La Especial Nueces", "meta_asignada": 1327, "meta_distribuida": 0,
+     "porcentaje_meta": 0.0, "incentivo_asignado": 500, "incentivo_distribuido": 0,
+     "porcentaje_variables_completadas": 0.0, "porcentaje_ejecucion_incentivo": 0.0,
+     "user_id": None, "program_id": 1},
+)
+
+# Spanish month names indexed by datetime month (index 0 unused)
+_MONTH_NAMES = (
+    "", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+    "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
+)
+
+# Statement texts shared by every execution. aiomysql speaks the MySQL text
+# protocol and offers no server-side prepared statements, so the closest
+# equivalent is reusing the exact same statement bytes per execution: the
+# server's digest-based caches and this module both parse each query once.
+_MAIN_QUERY = """
+SELECT
+    v.name_to_display as variable_name,
+    v.id as variable_id,
+    ROUND(COALESCE(SUM(l.goal), 0), 2) as total_meta_asignada,
+    ROUND(COALESCE(SUM(COALESCE(vendor_agg.total_vendor_goals, 0)), 0), 2) as total_meta_distribuida,
+    ROUND(CASE WHEN COALESCE(SUM(l.goal), 0) > 0
+               THEN SUM(COALESCE(vendor_agg.total_vendor_goals, 0)) / SUM(l.goal) * 100
+               ELSE 0 END, 2) as porcentaje_meta,
+    ROUND(COALESCE(SUM(l.results), 0), 2) as total_resultados_agente,
+    ROUND(COALESCE(SUM(COALESCE(vendor_agg.total_vendor_results, 0)), 0), 2) as total_resultados_vendors,
+    ROUND(COALESCE(SUM(COALESCE(rules_user.points_regla_user, 0) * %s), 0), 2) as total_incentivo_asignado,
+    ROUND(COALESCE(SUM(COALESCE(dist.total_incentivos_distribuidos, 0)), 0), 2) as total_incentivo_distribuido,
+    %s as point_value,
+    2 as user_id,
+    1 as program_id
+FROM liquidations l
+INNER JOIN variables v ON l.variable_id = v.id
+LEFT JOIN (
+    SELECT ru.variable_id, ru.points as points_regla_user
+    FROM rules ru
+    INNER JOIN rule_periods rp ON ru.id = rp.rule_id
+    WHERE rp.period_id = %s
+    AND ru.user_id = 2
+) rules_user ON l.variable_id = rules_user.variable_id
+LEFT JOIN (
+    SELECT l2.variable_id,
+           CASE WHEN l2.variable_id IN (3, 4)
+                THEN AVG(CASE WHEN l2.goal > 0 THEN l2.goal END)
+                ELSE SUM(CASE WHEN l2.goal > 0 THEN l2.goal END) END as total_vendor_goals,
+           CASE WHEN l2.variable_id IN (3, 4) THEN AVG(l2.results) ELSE SUM(l2.results) END as total_vendor_results
+    FROM liquidations l2
+    INNER JOIN people p2 ON l2.nin = p2.nin
+    INNER JOIN users u2 ON p2.id = u2.person_id
+    WHERE l2.period_id = %s
+    AND l2.program_id = 1
+    AND u2.role_id = 5
+    GROUP BY l2.variable_id
+) vendor_agg ON l.variable_id = vendor_agg.variable_id
+LEFT JOIN (
+    SELECT variable_id, SUM(incentive) as total_incentivos_distribuidos
+    FROM (
+        SELECT
+            u.id,
+            li.variable_id,
+            (ru.points * CAST(prog.pointValue AS DECIMAL(10,2))) as incentive
+        FROM users u
+        JOIN people p ON u.person_id = p.id
+        JOIN programs_users pu ON u.id = pu.user_id
+        JOIN programs prog ON pu.program_id = prog.id
+        JOIN roles r ON u.role_id = r.id
+        LEFT JOIN liquidations li ON p.nin = li.nin AND li.period_id = %s
+        LEFT JOIN rules ru ON ru.user_id = u.id AND ru.variable_id = li.variable_id
+        LEFT JOIN rule_periods rp ON rp.rule_id = ru.id AND rp.period_id = li.period_id
+        WHERE u.role_id IN (1, 2, 3, 5, 6)
+          AND rp.period_id = %s
+          AND li.variable_id IS NOT NULL
+          AND ru.points IS NOT NULL
+          AND prog.pointValue IS NOT NULL
+        GROUP BY u.id, li.period_id, li.variable_id, ru.points, prog.pointValue
+    ) as incentives
+    GROUP BY variable_id
+) dist ON l.variable_id = dist.variable_id
+WHERE l.period_id = %s
+AND l.program_id = 1
+AND l.nin = (SELECT nin FROM people WHERE id = (SELECT person_id FROM users WHERE id = 2))
+AND l.goal > 0
+AND UPPER(v.name_to_display) NOT LIKE '%%EJECUCI_N PRESUPUESTAL%%'
+GROUP BY v.id, v.name_to_display
+"""
+
+# Fallback used when the main query comes back empty: same shape, capped
+_SIMPLIFIED_QUERY = _MAIN_QUERY + "LIMIT 20"
+
+# Display order of the report variables; sorting the handful of aggregated
+# rows here is cheaper than an ORDER BY CASE filesort per agent in MySQL
+_VARIABLE_PRIORITY = {
+    'Ejecución Presupuestal': 1,
+    'Pideky': 2,
+    'Gestión de Activos': 3,
+    'Efectividad': 4
+}
+
+def _variable_sort_key(variable_name: str) -> tuple:
+    return (_VARIABLE_PRIORITY.get(variable_name, 5), variable_name)
+
+# subdomain -> (pointValue, monotonic expiry). The program point value
+# changes rarely, so it is fetched once per subdomain per TTL and bound into
+# the main statement instead of re-running a scalar subquery per execution
+_POINT_VALUE_TTL = 300.0
+_point_value_cache: Dict[str, tuple] = {}
+
+# (unix second, ISO-8601 string) memo so concurrent reports within the same
+# second share one formatted timestamp
+_generated_at_cache = [0, ""]
+
+def _generated_at() -> str:
+    """Current local time as an ISO-8601 string, cached per second"""
+    now = int(time.time())
+    if now != _generated_at_cache[0]:
+        _generated_at_cache[:] = [now, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now))]
+    return _generated_at_cache[1]
+
 class ReportService:
-    
-    def __init__(self):
-        """Initialize the service and load NIN data"""
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        """Initialize the service and load NIN data
+
+        max_concurrency bounds how many subdomains are processed at once;
+        it defaults to the per-database connection pool size so concurrent
+        agents never queue on an exhausted pool.
+        """
         self.nin_data = self._load_nin_data()
-    
+        self.max_concurrency = max_concurrency or settings.DB_POOL_SIZE
+
     def _load_nin_data(self) -> Dict[str, str]:
-        """Load NIN data from nin.json file - now returns direct mapping of subdomain to NIN"""
-        try:
-            nin_file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'static', 'nin.json')
-            with open(nin_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data
-        except Exception as e:
-            logger.error(f"Error loading nin.json: {str(e)}")
-            return {}
-    
+        """NIN data from nin.json - direct mapping of subdomain to NIN, cached at module level"""
+        nin_file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'static', 'nin.json')
+        return _load_nin_data_cached(nin_file_path)
+
     def _get_agent_code_by_subdomain(self, subdomain: str) -> str:
         """Get agent code (NIN) by subdomain using direct mapping"""
         if not subdomain or not self.nin_data:
@@ -39,59 +223,105 @@ class ReportService:
         """
         all_data = []
         processed_subdomains = []
-        
+
         # Get all available subdomains (process all 60 agents)
-        import time
-        start_time = time.time()
-        
-        all_subdomains = db_manager.get_available_subdomains()
-        subdomains = all_subdomains  # Process all agents
-        
-        for i, subdomain in enumerate(subdomains, 1):
-            try:
-                agent_start_time = time.time()
+        subdomains = db_manager.get_available_subdomains()
+
+        # The period label is identical across tenants; resolve and format it
+        # once instead of once per agent
+        period_info = await self._fetch_period_info(subdomains, period_id)
+
+        # Subdomains are separate schemas on the same server, but each query
+        # resolves tenant-local users/people rows, so they cannot be collapsed
+        # into one cross-schema statement. Process them concurrently instead,
+        # bounded so we don't exhaust the connection pool.
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _run_one(subdomain: str):
+            async with semaphore:
                 logger.info(f"Processing subdomain: {subdomain} for period: {period_id}")
-                subdomain_data = await self._get_subdomain_data(subdomain, period_id)
-                all_data.extend(subdomain_data)
-                processed_subdomains.append(subdomain)
-                
-            except Exception as e:
-                logger.error(f"Error processing subdomain {subdomain}: {str(e)}")
-                continue
-        
-        total_time = time.time() - start_time
-        
+                return await self._get_subdomain_data(subdomain, period_id, period_info)
+
+        tasks = [asyncio.create_task(_run_one(s)) for s in subdomains]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Failures surface here, once, via return_exceptions; the failed
+        # subdomain still contributes mock rows so the report stays complete
+        for subdomain, result in zip(subdomains, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error processing subdomain {subdomain}: {str(result)}")
+                # The verdict may be stale (dropped schema, dead connection);
+                # force a re-probe on the next request
+                db_manager.forget_required_tables(subdomain)
+                result = self._get_mock_data_new_structure(subdomain, period_id)
+
+            all_data.extend(result)
+            processed_subdomains.append(subdomain)
+
         return {
             "data": all_data,
             "total_records": len(all_data),
             "subdomains_processed": processed_subdomains,
-            "generated_at": datetime.now().isoformat()
+            "generated_at": _generated_at()
         }
     
-    async def _get_subdomain_data(self, subdomain: str, period_id: int) -> List[Dict[str, Any]]:
+    async def _fetch_period_info(self, subdomains: List[str], period_id: int) -> str:
+        """Resolve the formatted period label ("Agosto 2025") from the first reachable subdomain"""
+        for subdomain in subdomains[:3]:
+            try:
+                async with db_manager.acquire(subdomain) as connection:
+                    return await self._get_period_info(connection, period_id)
+            except Exception as e:
+                logger.warning(f"Could not fetch period info from {subdomain}: {str(e)}")
+        return f'Periodo {period_id}'
+
+    async def _get_subdomain_data(self, subdomain: str, period_id: int, period_info: str) -> List[Dict[str, Any]]:
         """
         Get report data for a specific subdomain and period following the new structure (optimized)
+
+        Exceptions propagate to generate_report, which collects them from the
+        gather and substitutes mock data; handling them here as well would
+        just log every failure twice.
         """
-        connection = None
-        try:
-            connection = await db_manager.get_connection(subdomain)
-            
-            # Quick table existence check
-            if not await self._check_tables_exist(connection):
+        cached = db_manager.has_required_tables(subdomain)
+        if cached is not None:
+            # Warm cache: no probe round-trip needed at all
+            if not cached:
                 logger.info(f"Tables not found in {subdomain}, using mock data")
                 return self._get_mock_data_new_structure(subdomain, period_id)
-            
-            # Get real data with optimized query
-            return await self._get_real_data_optimized(connection, subdomain, period_id)
-            
-        except Exception as e:
-            logger.error(f"Error processing subdomain {subdomain}: {str(e)}")
+            async with db_manager.acquire(subdomain) as connection:
+                return [row async for row in self._get_real_data_optimized(connection, subdomain, period_id, period_info)]
+
+        # Cold cache: run the existence probe and the data query in
+        # parallel instead of serially. aiomysql serializes statements per
+        # connection, so the probe gets its own pooled connection; if it
+        # comes back negative the data result is simply discarded.
+        async def _probe():
+            async with db_manager.acquire(subdomain) as connection:
+                return await self._tables_exist_cached(connection, subdomain)
+
+        async def _data():
+            async with db_manager.acquire(subdomain) as connection:
+                return [row async for row in self._get_real_data_optimized(connection, subdomain, period_id, period_info)]
+
+        tables_exist, subdomain_data = await asyncio.gather(_probe(), _data())
+
+        if not tables_exist:
+            logger.info(f"Tables not found in {subdomain}, using mock data")
             return self._get_mock_data_new_structure(subdomain, period_id)
-        finally:
-            # Always close the connection to prevent stale data
-            if connection:
-                await connection.ensure_closed()
+
+        return subdomain_data
     
+    async def _tables_exist_cached(self, connection, subdomain: str) -> bool:
+        """Memoized wrapper around _check_tables_exist backed by db_manager's shared cache"""
+        cached = db_manager.has_required_tables(subdomain)
+        if cached is not None:
+            return cached
+
+        exists = await self._check_tables_exist(connection)
+        db_manager.remember_required_tables(subdomain, exists)
+        return exists
+
     async def _check_tables_exist(self, connection) -> bool:
         """Check if required tables exist (optimized)"""
         try:
@@ -105,12 +335,7 @@ class ReportService:
             """)
             existing_tables = await cursor.fetchall()
             table_names = [table[0] for table in existing_tables]
-            
-            # Check liquidations table specifically and count records
-            if 'liquidations' in table_names:
-                await cursor.execute("SELECT COUNT(*) FROM liquidations")
-                liquidations_count = await cursor.fetchone()
-            
+
             await cursor.close()
             tables_found = len(table_names)
             return tables_found >= 6  # At least 6 main tables must exist
@@ -121,682 +346,240 @@ class ReportService:
     
     def _get_mock_data_new_structure(self, subdomain: str, period_id: int) -> List[Dict[str, Any]]:
         """Generate mock data by variable for the subdomain (agent commercial) for a specific period"""
-        
-        # Mock variables with their totals for the entire subdomain
-        # Based on the new liquidations table logic: MAX(goal) per vendor, SUM(results), SUM(points)
-        mock_variables_data = [
-            {
-                "variable_name": "CSI - Frijoles Zenú 2da Etapa",
-                "total_meta_asignada": 0,  # Sum of MAX goals per vendor
-                "total_meta_distribuida": 0,  # Sum of results from liquidations table
-                "total_incentivo_asignado": 0,  # Sum of points from liquidations table
-                "total_incentivo_distribuido": 0,  # Sum of points for approved liquidations
-                "porcentaje_variables_completadas": 0.0
-            },
-            {
-                "variable_name": "CSI - Snack de Película", 
-                "total_meta_asignada": 3,  # Sum of MAX goals per vendor from liquidations table
-                "total_meta_distribuida": 0,  # Sum of results from liquidations table
-                "total_incentivo_asignado": 150,  # Sum of points from liquidations table
-                "total_incentivo_distribuido": 0,  # Sum of points for approved liquidations
-                "porcentaje_variables_completadas": 0.0
-            },
-            {
-                "variable_name": "CSI - Tosh Manzanilla Limoncillo 2da Etapa",
-                "total_meta_asignada": 0,
-                "total_meta_distribuida": 0,
-                "total_incentivo_asignado": 0,
-                "total_incentivo_distribuido": 0,
-                "porcentaje_variables_completadas": 0.0
-            },
-            {
-                "variable_name": "CSI- Ahorramax 2da Etapa AU",
-                "total_meta_asignada": 0,
-                "total_meta_distribuida": 0,
-                "total_incentivo_asignado": 0,
-                "total_incentivo_distribuido": 0,
-                "porcentaje_variables_completadas": 0.0
-            },
-            {
-                "variable_name": "CSI- Ahorramax 2da Etapa TD",
-                "total_meta_asignada": 0,
-                "total_meta_distribuida": 0,
-                "total_incentivo_asignado": 0,
-                "total_incentivo_distribuido": 0,
-                "porcentaje_variables_completadas": 0.0
-            },
+        codigo_agente = self._get_agent_code_by_subdomain(subdomain)
+        agent_name = self._get_agent_name_by_subdomain(subdomain)
+        periodo_tiempo = f"Periodo {period_id}"
+
+        return [
             {
-                "variable_name": "DN - La Especial Nueces",
-                "total_meta_asignada": 1327,  # Sum of MAX goals per vendor from liquidations table
-                "total_meta_distribuida": 0,  # Sum of results from liquidations table
-                "total_incentivo_asignado": 500,  # Sum of points from liquidations table
-                "total_incentivo_distribuido": 0,  # Sum of points for approved liquidations
-                "porcentaje_variables_completadas": 0.0
+                "codigo_agente": codigo_agente,
+                "nombre_agente": agent_name,
+                "periodo_tiempo": periodo_tiempo,
+                **template
             }
+            for template in _MOCK_TEMPLATES
         ]
-        
-        report_data = []
-        
-        for var_data in mock_variables_data:
-            # Calculate compliance percentage correctly
-            porcentaje_meta = 0.0
-            if var_data["total_meta_asignada"] > 0:
-                porcentaje_meta = round((var_data["total_meta_distribuida"] / var_data["total_meta_asignada"]) * 100, 2)
-            
-            agent_name = self._get_agent_name_by_subdomain(subdomain)
-            report_row = {
-                "codigo_agente": self._get_agent_code_by_subdomain(subdomain),
+    
+    async def _aggregate_rows(self, cursor) -> tuple:
+        """Consume a report cursor into {variable_name: totals}; returns (variables_data, rows_seen)
+
+        Both query paths produce the same column set, so the grouping logic
+        lives here once instead of drifting between them.
+        """
+        variables_data = {}
+        rows_seen = 0
+
+        async for row in cursor:
+            rows_seen += 1
+            variable_name = row['variable_name']
+
+            # The GROUP BY returns one pre-aggregated row per variable,
+            # distributed incentives included. DECIMAL columns arrive as
+            # float already (see _CONVERSIONS in app.core.database), so only
+            # NULLs need defaulting here.
+            variables_data[variable_name] = {
+                'variable_id': row['variable_id'],
+                'total_meta_asignada': row['total_meta_asignada'] or 0.0,
+                'total_meta_distribuida': row['total_meta_distribuida'] or 0.0,
+                'porcentaje_meta': row['porcentaje_meta'] or 0.0,
+                'total_resultados_agente': row['total_resultados_agente'] or 0.0,
+                'total_resultados_vendors': row['total_resultados_vendors'] or 0.0,
+                'total_incentivo_asignado': row['total_incentivo_asignado'] or 0.0,
+                'total_incentivo_distribuido': row['total_incentivo_distribuido'] or 0.0,
+                'user_id': row['user_id'],
+                'program_id': row['program_id'],
+                'point_value': row['point_value'] or 500.0
+            }
+
+        return variables_data, rows_seen
+
+    def _reduce_rows(self, variables_data: Dict[str, Dict[str, Any]], subdomain: str, period_info: str):
+        """Yield display-ordered report rows plus the trailing TOTAL row"""
+        period_totals = {
+            'total_assigned_incentives': 0.0,
+            'total_given_incentives': 0.0,
+            'total_executed_incentive': 0.0,
+            'total_meta_asignada': 0.0,
+            'total_meta_distribuida': 0.0
+        }
+
+        codigo_agente = self._get_agent_code_by_subdomain(subdomain)
+        agent_name = self._get_agent_name_by_subdomain(subdomain)
+
+        # Count completed variables for percentage calculation
+        total_variables = len(variables_data)
+        completed_variables = sum(1 for var_data in variables_data.values()
+                                if var_data['total_meta_asignada'] > 0 and
+                                   var_data['total_meta_distribuida'] >= var_data['total_meta_asignada'])  # 100% or more
+
+        # Calculate variables completion percentage (real percentage of completed variables)
+        porcentaje_variables_completadas = 0.0
+        if total_variables > 0:
+            porcentaje_variables_completadas = round((completed_variables / total_variables) * 100, 2)
+
+        # Now create report rows from aggregated data, in display order
+        for variable_name in sorted(variables_data, key=_variable_sort_key):
+            var_data = variables_data[variable_name]
+            # Meta distribuida vs meta asignada comes pre-rounded from SQL
+            porcentaje_meta = var_data['porcentaje_meta']
+
+            # Calculate incentive execution percentage for this specific variable
+            executed_incentive = 0.0
+            if var_data['total_incentivo_asignado'] > 0:
+                executed_incentive = round((var_data['total_incentivo_distribuido'] / var_data['total_incentivo_asignado']) * 100, 2)
+
+            yield {
+                "codigo_agente": codigo_agente,
                 "nombre_agente": agent_name,
-                "periodo_tiempo": f"Periodo {period_id}",
-                "variable": var_data["variable_name"],
-                "meta_asignada": var_data["total_meta_asignada"],
-                "meta_distribuida": var_data["total_meta_distribuida"],
+                "periodo_tiempo": period_info,
+                "variable": variable_name,
+                "meta_asignada": round(var_data['total_meta_asignada'], 2),
+                "meta_distribuida": round(var_data['total_meta_distribuida'], 2),
                 "porcentaje_meta": porcentaje_meta,
-                "incentivo_asignado": var_data["total_incentivo_asignado"],
-                "incentivo_distribuido": var_data["total_incentivo_distribuido"],
-                "porcentaje_variables_completadas": var_data["porcentaje_variables_completadas"],
-                "porcentaje_ejecucion_incentivo": 0.0,  # Mock data has no execution
+                "incentivo_asignado": round(var_data['total_incentivo_asignado'], 2),
+                "incentivo_distribuido": round(var_data['total_incentivo_distribuido'], 2),
+                "porcentaje_variables_completadas": porcentaje_variables_completadas,
+                "porcentaje_ejecucion_incentivo": executed_incentive,
+                "user_id": var_data['user_id'],
+                "program_id": var_data['program_id']
+            }
+
+        # Period totals via fsum: error-free summation regardless of how
+        # many variables an agent has, unlike a naive running +=
+        values = variables_data.values()
+        period_totals['total_assigned_incentives'] = math.fsum(v['total_incentivo_asignado'] for v in values)
+        period_totals['total_given_incentives'] = math.fsum(v['total_incentivo_distribuido'] for v in values)
+        period_totals['total_meta_asignada'] = math.fsum(v['total_meta_asignada'] for v in values)
+        period_totals['total_meta_distribuida'] = math.fsum(v['total_meta_distribuida'] for v in values)
+
+        # Calculate total execution percentage
+        if period_totals['total_assigned_incentives'] > 0:
+            period_totals['total_executed_incentive'] = round(
+                (period_totals['total_given_incentives'] / period_totals['total_assigned_incentives']) * 100, 2
+            )
+
+        # Calculate total compliance percentage based on vendor performance
+        total_porcentaje_meta = 0.0
+        if period_totals['total_meta_distribuida'] > 0:
+            total_porcentaje_meta = round(
+                (period_totals['total_meta_distribuida'] / period_totals['total_meta_asignada']) * 100, 2
+            )
+
+        # Add TOTAL row
+        if variables_data:
+            yield {
+                "codigo_agente": codigo_agente,
+                "nombre_agente": agent_name,
+                "periodo_tiempo": period_info,
+                "variable": "TOTAL",
+                "meta_asignada": round(period_totals['total_meta_asignada'], 2),
+                "meta_distribuida": round(period_totals['total_meta_distribuida'], 2),
+                "porcentaje_meta": total_porcentaje_meta,
+                "incentivo_asignado": round(period_totals['total_assigned_incentives'], 2),
+                "incentivo_distribuido": round(period_totals['total_given_incentives'], 2),
+                "porcentaje_variables_completadas": porcentaje_variables_completadas,
+                "porcentaje_ejecucion_incentivo": period_totals['total_executed_incentive'],
                 "user_id": None,
                 "program_id": 1
             }
-            report_data.append(report_row)
-        
-        return report_data
-    
-    async def _get_distributed_incentives(self, connection, period_id: int) -> Dict[int, float]:
-        """
-        Separate query to get distributed incentives ONLY (sum of all incentives per variable)
-        This implements the exact logic from the provided query for incentivo distribuido
-        Los incentivos asignados siguen usando el cálculo original
-        """
-        cursor = await connection.cursor()
-        
-        try:
-            # Query that exactly matches the user's working SQL - first get individual incentives, then sum by variable
-            # This is ONLY for distributed incentives, not assigned
-            incentive_query = """
-            SELECT 
-                variable_id,
-                SUM(incentive) as total_incentivos_distribuidos
-            FROM (
-                SELECT
-                    u.id,
-                    l.variable_id,
-                    (ru.points * CAST(prog.pointValue AS DECIMAL(10,2))) as incentive
-                FROM users u
-                JOIN people p ON u.person_id = p.id
-                JOIN programs_users pu ON u.id = pu.user_id
-                JOIN programs prog ON pu.program_id = prog.id
-                JOIN roles r ON u.role_id = r.id
-                LEFT JOIN liquidations l ON p.nin = l.nin
-                LEFT JOIN rules ru ON ru.user_id = u.id AND ru.variable_id = l.variable_id
-                LEFT JOIN rule_periods rp ON rp.rule_id = ru.id AND rp.period_id = l.period_id
-                WHERE u.role_id IN (1, 2, 3, 5, 6)
-                  AND rp.period_id = %s
-                  AND l.variable_id IS NOT NULL
-                  AND ru.points IS NOT NULL
-                  AND prog.pointValue IS NOT NULL
-                GROUP BY u.id, l.period_id, l.variable_id, ru.points, prog.pointValue
-            ) as subquery
-            GROUP BY variable_id
-            """
-            
-            await cursor.execute(incentive_query, (period_id,))
-            results = await cursor.fetchall()
-            
-            # Convert to dictionary: variable_id -> total_distributed_incentive
-            distributed_incentives_by_variable = {}
-            for row in results:
-                variable_id, total_distributed_incentive = row
-                distributed_incentives_by_variable[variable_id] = float(total_distributed_incentive or 0)
-            
-            return distributed_incentives_by_variable
-            
-        except Exception as e:
-            logger.error(f"Error getting distributed incentives: {str(e)}")
-            return {}
-        finally:
-            await cursor.close()
 
-    async def _get_real_data_optimized(self, connection, subdomain: str, period_id: int) -> List[Dict[str, Any]]:
-        """Get real data from database aggregated by variable for the subdomain (agent commercial) for a specific period"""
+    async def _get_point_value(self, connection, subdomain: str) -> float:
+        """Fetch the program point value for a subdomain, memoized with a short TTL"""
+        cached = _point_value_cache.get(subdomain)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+
         cursor = await connection.cursor()
+        await cursor.execute("SELECT pointValue FROM programs WHERE id = 1")
+        result = await cursor.fetchone()
+        await cursor.close()
+
+        point_value = float(result[0]) if result and result[0] is not None else 500.0
+        _point_value_cache[subdomain] = (point_value, time.monotonic() + _POINT_VALUE_TTL)
+        return point_value
+
+    async def _get_real_data_optimized(self, connection, subdomain: str, period_id: int, period_info: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield report rows aggregated by variable for the subdomain (agent commercial) for a specific period
+
+        Rows are produced lazily so callers can stream them instead of
+        holding two copies of the report in memory. The unbuffered cursor
+        keeps the server-side result set out of client memory too: rows
+        arrive one at a time as _aggregate_rows consumes them.
+        """
+        cursor = await connection.cursor(aiomysql.SSDictCursor)
 
         try:
-            # Get distributed incentives using separate query
-            distributed_incentives = await self._get_distributed_incentives(connection, period_id)
-                
-            # Main query without the complex incentive distributed logic
-            query = """
-            SELECT
-                v.name_to_display as variable_name,
-                v.id as variable_id,
-                l.goal as meta_asignada_agente,
-                COALESCE(vendor_goals.total_vendor_goals, 0) as meta_distribuida_vendors,
-                l.results as resultados_agente,
-                COALESCE(vendor_results.total_vendor_results, 0) as resultados_vendors,
-                ROUND((COALESCE(vendor_results.total_vendor_results, 0) / COALESCE(vendor_goals.total_vendor_goals, 1)) * 100, 2) as cumplimiento_porcentaje,
-                COALESCE(rules_user.points_regla_user, 0) * (SELECT pointValue FROM programs WHERE id = 1) as incentivo_asignado_puntos,
-                (SELECT pointValue FROM programs WHERE id = 1) as point_value,
-                2 as user_id,
-                1 as program_id
-            FROM liquidations l
-            INNER JOIN variables v ON l.variable_id = v.id
-            LEFT JOIN (
-                SELECT ru.variable_id, ru.points as points_regla_user
-                FROM rules ru
-                INNER JOIN rule_periods rp ON ru.id = rp.rule_id
-                WHERE rp.period_id = %s
-                AND ru.user_id = 2
-            ) rules_user ON l.variable_id = rules_user.variable_id
-            LEFT JOIN (
-                SELECT l2.variable_id, 
-                       CASE WHEN l2.variable_id IN (3, 4) THEN AVG(l2.goal) ELSE SUM(l2.goal) END as total_vendor_goals
-                FROM liquidations l2
-                INNER JOIN people p2 ON l2.nin = p2.nin
-                INNER JOIN users u2 ON p2.id = u2.person_id
-                WHERE l2.period_id = %s
-                AND l2.program_id = 1
-                AND u2.role_id = 5
-                AND l2.goal > 0
-                GROUP BY l2.variable_id
-            ) vendor_goals ON l.variable_id = vendor_goals.variable_id
-            LEFT JOIN (
-                SELECT l3.variable_id, 
-                       CASE WHEN l3.variable_id IN (3, 4) THEN AVG(l3.results) ELSE SUM(l3.results) END as total_vendor_results
-                FROM liquidations l3
-                INNER JOIN people p3 ON l3.nin = p3.nin
-                INNER JOIN users u3 ON p3.id = u3.person_id
-                WHERE l3.period_id = %s
-                AND l3.program_id = 1
-                AND u3.role_id = 5
-                GROUP BY l3.variable_id
-            ) vendor_results ON l.variable_id = vendor_results.variable_id
-            WHERE l.period_id = %s
-            AND l.program_id = 1
-            AND l.nin = (SELECT nin FROM people WHERE id = (SELECT person_id FROM users WHERE id = 2))
-            AND l.goal > 0
-            ORDER BY
-                CASE
-                    WHEN v.name_to_display = 'Ejecución Presupuestal' THEN 1
-                    WHEN v.name_to_display = 'Pideky' THEN 2
-                    WHEN v.name_to_display = 'Gestión de Activos' THEN 3
-                    WHEN v.name_to_display = 'Efectividad' THEN 4
-                    ELSE 5
-                END,
-                v.name_to_display
-            """
-
-            print(f"🔍 Executing main query for period {period_id}...")
-            await cursor.execute(query, (period_id, period_id, period_id, period_id))
-            results = await cursor.fetchall()
-
-            # If no results, try a simpler query
-            if not results:
-                return await self._get_simplified_data(connection, subdomain, period_id)
-
-            report_data = []
-            period_totals = {
-                'total_assigned_incentives': 0.0,
-                'total_given_incentives': 0.0,
-                'total_executed_incentive': 0.0,
-                'total_meta_asignada': 0.0,
-                'total_meta_distribuida': 0.0
-            }
+            point_value = await self._get_point_value(connection, subdomain)
 
-            # Get agent name
-            agent_name = self._get_agent_name_by_subdomain(subdomain)
+            logger.debug(f"Executing main query for period {period_id}")
+            await cursor.execute(_MAIN_QUERY, (point_value, point_value) + (period_id,) * 5)
+            variables_data, rows_seen = await self._aggregate_rows(cursor)
 
-            # Get period information
-            period_info = await self._get_period_info(connection, period_id)
+            # If no results, try a simpler query. Close first so the
+            # connection is free for the next unbuffered statement.
+            if rows_seen == 0:
+                await cursor.close()
+                async for report_row in self._get_simplified_data(connection, subdomain, period_id, period_info):
+                    yield report_row
+                return
 
-            # Group results by variable to avoid duplicates
-            variables_data = {}
-            
-            for row in results:
-                (variable_name, variable_id, meta_asignada_agente, meta_distribuida_vendors, resultados_agente, resultados_vendors, cumplimiento_porcentaje,
-                 incentivo_asignado_puntos, point_value,
-                 user_id, program_id) = row
-
-                # Skip "Ejecución Presupuestal" variable (matches frontend logic)
-                if 'Ejecución Presupuestal' in variable_name or 'EJECUCIÓN PRESUPUESTAL' in variable_name.upper():
-                    continue
-
-                # Use variable_name as key for grouping
-                if variable_name not in variables_data:
-                    variables_data[variable_name] = {
-                        'variable_id': variable_id,
-                        'total_meta_asignada': 0.0,
-                        'total_meta_distribuida': 0.0,
-                        'total_resultados_agente': 0.0,
-                        'total_resultados_vendors': 0.0,
-                        'total_incentivo_asignado': 0.0,
-                        'total_incentivo_distribuido': 0.0,
-                        'user_id': user_id,
-                        'program_id': program_id,
-                        'point_value': float(point_value) if point_value else 500.0
-                    }
-                
-                # Accumulate values for this variable
-                variables_data[variable_name]['total_meta_asignada'] += float(meta_asignada_agente or 0)
-                variables_data[variable_name]['total_meta_distribuida'] += float(meta_distribuida_vendors or 0)
-                variables_data[variable_name]['total_resultados_agente'] += float(resultados_agente or 0)
-                variables_data[variable_name]['total_resultados_vendors'] += float(resultados_vendors or 0)
-                variables_data[variable_name]['total_incentivo_asignado'] += float(incentivo_asignado_puntos or 0)
-                
-                # Get distributed incentive from separate query
-                distributed_incentive = distributed_incentives.get(variable_id, 0.0)
-                variables_data[variable_name]['total_incentivo_distribuido'] += distributed_incentive
-
-            # Count completed variables for percentage calculation
-            total_variables = len(variables_data)
-            completed_variables = sum(1 for var_data in variables_data.values() 
-                                    if var_data['total_meta_asignada'] > 0 and 
-                                       var_data['total_meta_distribuida'] >= var_data['total_meta_asignada'])  # 100% or more
-
-            # Now create report rows from aggregated data
-            for variable_name, var_data in variables_data.items():
-                # Calculate percentage of meta distributed vs meta assigned (Meta Distribuida / Meta Asignada)
-                porcentaje_meta = 0.0
-                if var_data['total_meta_asignada'] > 0:
-                    porcentaje_meta = round((var_data['total_meta_distribuida'] / var_data['total_meta_asignada']) * 100, 2)
-                
-                # Calculate incentive execution percentage for this specific variable
-                executed_incentive = 0.0
-                if var_data['total_incentivo_asignado'] > 0:
-                    executed_incentive = round((var_data['total_incentivo_distribuido'] / var_data['total_incentivo_asignado']) * 100, 2)
-                
-                # Calculate variables completion percentage (real percentage of completed variables)
-                porcentaje_variables_completadas = 0.0
-                if total_variables > 0:
-                    porcentaje_variables_completadas = round((completed_variables / total_variables) * 100, 2)
-
-                # Create report row
-                report_row = {
-                    "codigo_agente": self._get_agent_code_by_subdomain(subdomain),
-                    "nombre_agente": agent_name,
-                    "periodo_tiempo": period_info,
-                    "variable": variable_name,
-                    "meta_asignada": round(var_data['total_meta_asignada'], 2),
-                    "meta_distribuida": round(var_data['total_meta_distribuida'], 2),
-                    "porcentaje_meta": porcentaje_meta,
-                    "incentivo_asignado": round(var_data['total_incentivo_asignado'], 2),
-                    "incentivo_distribuido": round(var_data['total_incentivo_distribuido'], 2),
-                    "porcentaje_variables_completadas": round(porcentaje_variables_completadas, 2),
-                    "porcentaje_ejecucion_incentivo": executed_incentive,
-                    "user_id": var_data['user_id'],
-                    "program_id": var_data['program_id']
-                }
-
-                report_data.append(report_row)
-
-                # Accumulate period totals
-                period_totals['total_assigned_incentives'] += var_data['total_incentivo_asignado']
-                period_totals['total_given_incentives'] += var_data['total_incentivo_distribuido']
-                period_totals['total_meta_asignada'] += var_data['total_meta_asignada']
-                period_totals['total_meta_distribuida'] += var_data['total_meta_distribuida']
-
-            # Calculate total execution percentage
-            if period_totals['total_assigned_incentives'] > 0:
-                period_totals['total_executed_incentive'] = round(
-                    (period_totals['total_given_incentives'] / period_totals['total_assigned_incentives']) * 100, 2
-                )
-
-            # Calculate total compliance percentage based on vendor performance
-            total_porcentaje_meta = 0.0
-            if period_totals['total_meta_distribuida'] > 0:
-                total_porcentaje_meta = round(
-                    (period_totals['total_meta_distribuida'] / period_totals['total_meta_asignada']) * 100, 2
-                )
-
-            # Add TOTAL row
-            if report_data:
-                total_row = {
-                    "codigo_agente": self._get_agent_code_by_subdomain(subdomain),
-                    "nombre_agente": agent_name,
-                    "periodo_tiempo": period_info,
-                    "variable": "TOTAL",
-                    "meta_asignada": round(period_totals['total_meta_asignada'], 2),
-                    "meta_distribuida": round(period_totals['total_meta_distribuida'], 2),
-                    "porcentaje_meta": total_porcentaje_meta,
-                    "incentivo_asignado": round(period_totals['total_assigned_incentives'], 2),
-                    "incentivo_distribuido": round(period_totals['total_given_incentives'], 2),
-                    "porcentaje_variables_completadas": round((completed_variables / total_variables) * 100, 2) if total_variables > 0 else 0.0,
-                    "porcentaje_ejecucion_incentivo": period_totals['total_executed_incentive'],
-                    "user_id": None,
-                    "program_id": 1
-                }
-                report_data.append(total_row)
-
-            return report_data
+            for report_row in self._reduce_rows(variables_data, subdomain, period_info):
+                yield report_row
 
         except Exception as e:
             logger.error(f"Error in optimized query for {subdomain}: {str(e)}")
-            return self._get_mock_data_new_structure(subdomain, period_id)
+            for report_row in self._get_mock_data_new_structure(subdomain, period_id):
+                yield report_row
         finally:
             await cursor.close()
 
-    async def _get_simplified_data(self, connection, subdomain: str, period_id: int) -> List[Dict[str, Any]]:
-        """Get simplified data when full query fails - matches working SQL logic with basic calculations"""
-        cursor = await connection.cursor()
+    async def _get_simplified_data(self, connection, subdomain: str, period_id: int, period_info: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield simplified data when the main query returns nothing - same statement shape, capped at 20 variables"""
+        cursor = await connection.cursor(aiomysql.SSDictCursor)
 
         try:
-            # Get distributed incentives using separate query
-            distributed_incentives = await self._get_distributed_incentives(connection, period_id)
-            
-            # Simplified main query without complex incentive logic
-            simple_query = """
-            SELECT
-                v.name_to_display as variable_name,
-                v.id as variable_id,
-                l.goal as meta_asignada_agente,
-                COALESCE(vendor_goals.total_vendor_goals, 0) as meta_distribuida_vendors,
-                l.results as resultados_agente,
-                COALESCE(vendor_results.total_vendor_results, 0) as resultados_vendors,
-                ROUND((COALESCE(vendor_results.total_vendor_results, 0) / COALESCE(vendor_goals.total_vendor_goals, 1)) * 100, 2) as cumplimiento_porcentaje,
-                COALESCE(rules_user.points_regla_user, 0) * (SELECT pointValue FROM programs WHERE id = 1) as incentivo_asignado_puntos,
-                (SELECT pointValue FROM programs WHERE id = 1) as point_value,
-                2 as user_id,
-                1 as program_id
-            FROM liquidations l
-            INNER JOIN variables v ON l.variable_id = v.id
-            LEFT JOIN (
-                SELECT ru.variable_id, ru.points as points_regla_user
-                FROM rules ru
-                INNER JOIN rule_periods rp ON ru.id = rp.rule_id
-                WHERE rp.period_id = %s
-                AND ru.user_id = 2
-            ) rules_user ON l.variable_id = rules_user.variable_id
-            LEFT JOIN (
-                SELECT l2.variable_id, 
-                       CASE WHEN l2.variable_id IN (3, 4) THEN AVG(l2.goal) ELSE SUM(l2.goal) END as total_vendor_goals
-                FROM liquidations l2
-                INNER JOIN people p2 ON l2.nin = p2.nin
-                INNER JOIN users u2 ON p2.id = u2.person_id
-                WHERE l2.period_id = %s
-                AND l2.program_id = 1
-                AND u2.role_id = 5
-                AND l2.goal > 0
-                GROUP BY l2.variable_id
-            ) vendor_goals ON l.variable_id = vendor_goals.variable_id
-            LEFT JOIN (
-                SELECT l3.variable_id, 
-                       CASE WHEN l3.variable_id IN (3, 4) THEN AVG(l3.results) ELSE SUM(l3.results) END as total_vendor_results
-                FROM liquidations l3
-                INNER JOIN people p3 ON l3.nin = p3.nin
-                INNER JOIN users u3 ON p3.id = u3.person_id
-                WHERE l3.period_id = %s
-                AND l3.program_id = 1
-                AND u3.role_id = 5
-                GROUP BY l3.variable_id
-            ) vendor_results ON l.variable_id = vendor_results.variable_id
-            WHERE l.period_id = %s
-            AND l.program_id = 1
-            AND l.nin = (SELECT nin FROM people WHERE id = (SELECT person_id FROM users WHERE id = 2))
-            AND l.goal > 0
-            ORDER BY
-                CASE
-                    WHEN v.name_to_display = 'Ejecución Presupuestal' THEN 1
-                    WHEN v.name_to_display = 'Pideky' THEN 2
-                    WHEN v.name_to_display = 'Gestión de Activos' THEN 3
-                    WHEN v.name_to_display = 'Efectividad' THEN 4
-                    ELSE 5
-                END,
-                v.name_to_display
-            LIMIT 20
-            """
-
-            await cursor.execute(simple_query, (period_id, period_id, period_id, period_id))
-            simple_results = await cursor.fetchall()
-
-            if not simple_results:
-                return self._get_mock_data_new_structure(subdomain, period_id)
-
-            report_data = []
-            period_totals = {
-                'total_assigned_incentives': 0.0,
-                'total_given_incentives': 0.0,
-                'total_executed_incentive': 0.0,
-                'total_meta_asignada': 0.0,
-                'total_meta_distribuida': 0.0
-            }
+            point_value = await self._get_point_value(connection, subdomain)
+            await cursor.execute(_SIMPLIFIED_QUERY, (point_value, point_value) + (period_id,) * 5)
+            variables_data, rows_seen = await self._aggregate_rows(cursor)
 
-            agent_name = self._get_agent_name_by_subdomain(subdomain)
+            if rows_seen == 0:
+                for report_row in self._get_mock_data_new_structure(subdomain, period_id):
+                    yield report_row
+                return
 
-            # Get period information
-            period_info = await self._get_period_info(connection, period_id)
-
-            # Group results by variable to avoid duplicates
-            variables_data = {}
-            
-            for row in simple_results:
-                (variable_name, variable_id, meta_asignada_agente, meta_distribuida_vendors, resultados_agente, resultados_vendors, cumplimiento_porcentaje,
-                 incentivo_asignado_puntos, point_value,
-                 user_id, program_id) = row
-
-                # Skip "Ejecución Presupuestal" variable
-                if 'Ejecución Presupuestal' in variable_name or 'EJECUCIÓN PRESUPUESTAL' in variable_name.upper():
-                    continue
-
-                # Use variable_name as key for grouping
-                if variable_name not in variables_data:
-                    variables_data[variable_name] = {
-                        'variable_id': variable_id,
-                        'total_meta_asignada': 0.0,
-                        'total_meta_distribuida': 0.0,
-                        'total_resultados_agente': 0.0,
-                        'total_resultados_vendors': 0.0,
-                        'total_incentivo_asignado': 0.0,
-                        'total_incentivo_distribuido': 0.0,
-                        'user_id': user_id,
-                        'program_id': program_id,
-                        'point_value': float(point_value) if point_value else 500.0
-                    }
-                
-                # Accumulate values for this variable
-                variables_data[variable_name]['total_meta_asignada'] += float(meta_asignada_agente or 0)
-                variables_data[variable_name]['total_meta_distribuida'] += float(meta_distribuida_vendors or 0)
-                variables_data[variable_name]['total_resultados_agente'] += float(resultados_agente or 0)
-                variables_data[variable_name]['total_resultados_vendors'] += float(resultados_vendors or 0)
-                variables_data[variable_name]['total_incentivo_asignado'] += float(incentivo_asignado_puntos or 0)
-                
-                # Get distributed incentive from separate query
-                distributed_incentive = distributed_incentives.get(variable_id, 0.0)
-                variables_data[variable_name]['total_incentivo_distribuido'] += distributed_incentive
-
-            # Count completed variables for percentage calculation
-            total_variables = len(variables_data)
-            completed_variables = sum(1 for var_data in variables_data.values() 
-                                    if var_data['total_meta_asignada'] > 0 and 
-                                       var_data['total_meta_distribuida'] >= var_data['total_meta_asignada'])  # 100% or more
-
-            # Now create report rows from aggregated data
-            for variable_name, var_data in variables_data.items():
-                # Calculate percentage of meta distributed vs meta assigned (Meta Distribuida / Meta Asignada)
-                porcentaje_meta = 0.0
-                if var_data['total_meta_asignada'] > 0:
-                    porcentaje_meta = round((var_data['total_meta_distribuida'] / var_data['total_meta_asignada']) * 100, 2)
-                
-                # Calculate incentive execution percentage for this specific variable
-                executed_incentive = 0.0
-                if var_data['total_incentivo_asignado'] > 0:
-                    executed_incentive = round((var_data['total_incentivo_distribuido'] / var_data['total_incentivo_asignado']) * 100, 2)
-                
-                # Calculate variables completion percentage (real percentage of completed variables)
-                porcentaje_variables_completadas = 0.0
-                if total_variables > 0:
-                    porcentaje_variables_completadas = round((completed_variables / total_variables) * 100, 2)
-
-                report_row = {
-                    "codigo_agente": self._get_agent_code_by_subdomain(subdomain),
-                    "nombre_agente": agent_name,
-                    "periodo_tiempo": period_info,
-                    "variable": variable_name,
-                    "meta_asignada": round(var_data['total_meta_asignada'], 2),
-                    "meta_distribuida": round(var_data['total_meta_distribuida'], 2),
-                    "porcentaje_meta": porcentaje_meta,
-                    "incentivo_asignado": round(var_data['total_incentivo_asignado'], 2),
-                    "incentivo_distribuido": round(var_data['total_incentivo_distribuido'], 2),
-                    "porcentaje_variables_completadas": round(porcentaje_variables_completadas, 2),
-                    "porcentaje_ejecucion_incentivo": executed_incentive,
-                    "user_id": var_data['user_id'],
-                    "program_id": var_data['program_id']
-                }
-
-                report_data.append(report_row)
-
-                # Accumulate period totals
-                period_totals['total_assigned_incentives'] += var_data['total_incentivo_asignado']
-                period_totals['total_given_incentives'] += var_data['total_incentivo_distribuido']
-                period_totals['total_meta_asignada'] += var_data['total_meta_asignada']
-                period_totals['total_meta_distribuida'] += var_data['total_meta_distribuida']
-
-            # Calculate total execution percentage
-            if period_totals['total_assigned_incentives'] > 0:
-                period_totals['total_executed_incentive'] = round(
-                    (period_totals['total_given_incentives'] / period_totals['total_assigned_incentives']) * 100, 2
-                )
-
-            # Calculate total compliance percentage based on vendor performance
-            total_porcentaje_meta = 0.0
-            if period_totals['total_meta_distribuida'] > 0:
-                total_porcentaje_meta = round(
-                    (period_totals['total_meta_distribuida'] / period_totals['total_meta_asignada']) * 100, 2
-                )
-
-            # Add TOTAL row
-            if report_data:
-                total_row = {
-                    "codigo_agente": self._get_agent_code_by_subdomain(subdomain),
-                    "nombre_agente": agent_name,
-                    "periodo_tiempo": period_info,
-                    "variable": "TOTAL",
-                    "meta_asignada": round(period_totals['total_meta_asignada'], 2),
-                    "meta_distribuida": round(period_totals['total_meta_distribuida'], 2),
-                    "porcentaje_meta": total_porcentaje_meta,
-                    "incentivo_asignado": round(period_totals['total_assigned_incentives'], 2),
-                    "incentivo_distribuido": round(period_totals['total_given_incentives'], 2),
-                    "porcentaje_variables_completadas": round((completed_variables / total_variables) * 100, 2) if total_variables > 0 else 0.0,
-                    "porcentaje_ejecucion_incentivo": period_totals['total_executed_incentive'],
-                    "user_id": None,
-                    "program_id": 1
-                }
-                report_data.append(total_row)
-
-            return report_data
+            for report_row in self._reduce_rows(variables_data, subdomain, period_info):
+                yield report_row
 
         except Exception as e:
             logger.error(f"Error in simplified query for {subdomain}: {str(e)}")
-            return self._get_mock_data_new_structure(subdomain, period_id)
+            for report_row in self._get_mock_data_new_structure(subdomain, period_id):
+                yield report_row
         finally:
             await cursor.close()
-    
+
     def _get_agent_name_by_subdomain(self, subdomain: str) -> str:
         """Get agent name based on subdomain"""
-        agent_names = {
-            "1030773": "A.H.H. DISTRIBUCIONES S.A.S",
-            "1089723": "NUTRICOL SAS",
-            "comercruz": "COMERCRUZ DISTRIBUCIONES",
-            "santiagodetunja": "SANTIAGO DE TUNJA COMERCIAL",
-            "maxgol": "MAXGOL DISTRIBUCIONES",
-            "distrimarcasagentecomercial": "DISTRIMARCAS",
-            "jyddistribuciones": "JYD DISTRIBUCIONES",
-            "lideraliados": "LIDERALIADOS"
-        }
-        
-        return agent_names.get(subdomain, subdomain.upper())
+        return _AGENT_NAMES.get(subdomain, subdomain.upper())
     
     def _format_period(self, period_start) -> str:
         """Format period date to Spanish month year"""
         if not period_start:
             return "Periodo Desconocido"
-        
+
         # Handle case where period_start might be an integer or other type
         if isinstance(period_start, int):
             return f"Periodo {period_start}"  # Use period ID as fallback
-        
-        # Handle case where period_start is a datetime object
-        if hasattr(period_start, 'month') and hasattr(period_start, 'year'):
-            month_names = {
-                1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
-                5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
-                9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
-            }
-            
-            month_name = month_names.get(period_start.month, "")
-            return f"{month_name} {period_start.year}"
-        
+
+        # date and datetime both index straight into the month table
+        if isinstance(period_start, date):
+            return f"{_MONTH_NAMES[period_start.month]} {period_start.year}"
+
         # Fallback for any other type
         return "Periodo Desconocido"
     
-    async def _get_completion_percentage_fast(self, cursor, user_id: int, period_id: int) -> float:
-        """Fast completion percentage calculation"""
-        try:
-            query = """
-            SELECT 
-                COUNT(DISTINCT l.variable_id) as total,
-                COUNT(DISTINCT CASE WHEN l.results > 0 THEN l.variable_id END) as completed
-            FROM liquidations l
-            JOIN people p ON l.nin = p.nin
-            JOIN users u ON p.id = u.person_id
-            WHERE u.id = %s AND l.period_id = %s
-            """
-            
-            await cursor.execute(query, (user_id, period_id))
-            result = await cursor.fetchone()
-            
-            if result and result[0] > 0:
-                total, completed = result
-                return round((completed / total) * 100, 2)
-            return 0.0
-            
-        except Exception as e:
-            logger.error(f"Error calculating completion percentage: {str(e)}")
-            return 0.0
-    
-    # Additional utility methods for backward compatibility and future use
-    async def _calculate_incentives(self, connection, user_id: int, variable_id: int, period_id: int) -> Dict[str, float]:
-        """
-        Calculate incentive assigned and distributed based on points and point value
-        (Kept for potential future use or backward compatibility)
-        """
-        try:
-            cursor = await connection.cursor()
-            
-            # Get assigned points and point value in single query
-            query = """
-            SELECT ru.points, pr.pointValue
-            FROM rules ru
-            JOIN rule_periods rp ON rp.rule_id = ru.id
-            JOIN programs_users pu ON pu.user_id = ru.user_id
-            JOIN programs pr ON pr.id = pu.program_id
-            WHERE ru.user_id = %s 
-              AND ru.variable_id = %s 
-              AND rp.period_id = %s
-            """
-            
-            await cursor.execute(query, (user_id, variable_id, period_id))
-            result = await cursor.fetchone()
-            await cursor.close()
-            
-            if result and result[0] and result[1]:
-                points, point_value = result
-                incentivo_asignado = float(points) * float(point_value)
-                return {
-                    "asignado": incentivo_asignado,
-                    "distribuido": incentivo_asignado  # Can be modified based on achievement
-                }
-            
-            return {"asignado": 0.0, "distribuido": 0.0}
-            
-        except Exception as e:
-            logger.error(f"Error calculating incentives: {str(e)}")
-            return {"asignado": 0.0, "distribuido": 0.0}
-    
     async def _get_period_info(self, connection, period_id: int) -> str:
         """
         Get period information formatted as "Month Year" (e.g., "Agosto 2025")
-        (Kept for potential future use or backward compatibility)
         """
         try:
             query = "SELECT start_date FROM periods WHERE id = %s"
@@ -812,57 +595,3 @@ class ReportService:
         except Exception as e:
             logger.error(f"Error getting period info: {str(e)}")
             return f'Periodo {period_id}'
-    
-    async def _get_variable_name(self, connection, variable_id: int) -> str:
-        """
-        Get variable name by ID
-        (Kept for potential future use or backward compatibility)
-        """
-        try:
-            query = "SELECT name FROM variables WHERE id = %s"
-            cursor = await connection.cursor()
-            await cursor.execute(query, (variable_id,))
-            result = await cursor.fetchone()
-            await cursor.close()
-            
-            if result and result[0]:
-                return result[0]
-            return 'Variable'
-            
-        except Exception as e:
-            logger.error(f"Error getting variable name: {str(e)}")
-            return 'Variable'
-    
-    async def _calculate_variables_completion_percentage(self, connection, user_id: int, period_id: int) -> float:
-        """
-        Calculate percentage of variables completed for a user in a specific period
-        (Kept for potential future use or backward compatibility)
-        """
-        try:
-            cursor = await connection.cursor()
-            
-            # Combined query for efficiency
-            query = """
-            SELECT 
-                COUNT(DISTINCT l.variable_id) as total_variables,
-                COUNT(DISTINCT CASE WHEN l.results > 0 THEN l.variable_id END) as completed_variables
-            FROM liquidations l
-            JOIN people p ON l.nin = p.nin
-            JOIN users u ON p.id = u.person_id
-            WHERE u.id = %s AND l.period_id = %s
-            """
-            
-            await cursor.execute(query, (user_id, period_id))
-            result = await cursor.fetchone()
-            await cursor.close()
-            
-            if result and result[0] > 0:
-                total_variables, completed_variables = result
-                percentage = (completed_variables / total_variables) * 100
-                return round(percentage, 2)
-            
-            return 0.0
-            
-        except Exception as e:
-            logger.error(f"Error calculating variables completion percentage: {str(e)}")
-            return 0.0
\ No newline at end of file
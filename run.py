@@ -12,5 +12,11 @@ if __name__ == "__main__":
         port=port,
         reload=False,  # Deshabilitado en producción
         log_level="info",
-        workers=1  # PM2 manejará los workers
+        # uvloop + httptools replace asyncio + h11 with their C
+        # implementations; both ship with uvicorn[standard]
+        loop="uvloop",
+        http="httptools",
+        # PM2 maneja los workers por defecto; WORKERS permite correr
+        # uvicorn standalone con su propio pool
+        workers=int(os.getenv("WORKERS", 1))
     )